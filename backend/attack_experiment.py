@@ -34,19 +34,21 @@ def main():
     # pick a few user IDs to inspect
     user_ids = [1, 10, 50, 100, 150]
 
-    for uid in user_ids:
+    # Score all inspected users at once per scenario
+    base_all = scen.baseline_model.recommend_batch(user_ids, top_k=50)
+    atk_all = scen.attack_model.recommend_batch(user_ids, top_k=50)
+    def_all = scen.defense_model.recommend_batch(user_ids, top_k=50)
+
+    for uid, base_recs, atk_recs, def_recs in zip(user_ids, base_all, atk_all, def_all):
         print(f"--- User {uid} ---")
 
         # Baseline recommendations
-        base_recs = scen.baseline_model.recommend(user_id=uid, top_k=50)
         base_rank, base_score = find_rank_of_item(base_recs, target_id)
 
         # Attack recommendations
-        atk_recs = scen.attack_model.recommend(user_id=uid, top_k=50)
         atk_rank, atk_score = find_rank_of_item(atk_recs, target_id)
 
         # Defense recommendations
-        def_recs = scen.defense_model.recommend(user_id=uid, top_k=50)
         def_rank, def_score = find_rank_of_item(def_recs, target_id)
 
         print(f"Baseline: rank={base_rank}, score={base_score}")
@@ -23,8 +23,11 @@ app.add_middleware(
 
 # ---------------- Load models once ----------------
 
-# Assumes u.data and u.item are in the same folder as this file
-scenario_rec = ScenarioRecommender(data_path="u.data", movie_path="u.item")
+# Assumes u.data and u.item are in the same folder as this file.
+# Built models are cached under cache/, so restarts skip the rebuild.
+scenario_rec = ScenarioRecommender(
+    data_path="u.data", movie_path="u.item", cache_dir="cache"
+)
 
 
 # ---------------- Request models ----------------
@@ -57,27 +57,19 @@ def main():
         "defense": {"hits": 0, "ranks": []},
     }
 
-    for uid in user_ids:
-        # Baseline recs
-        base_recs = scen.baseline_model.recommend(user_id=uid, top_k=k)
-        base_rank, _ = find_rank_of_item(base_recs, target_id)
-        if base_rank is not None:
-            metrics["baseline"]["hits"] += 1
-            metrics["baseline"]["ranks"].append(base_rank)
-
-        # Attack recs
-        atk_recs = scen.attack_model.recommend(user_id=uid, top_k=k)
-        atk_rank, _ = find_rank_of_item(atk_recs, target_id)
-        if atk_rank is not None:
-            metrics["attack"]["hits"] += 1
-            metrics["attack"]["ranks"].append(atk_rank)
-
-        # Defense recs
-        def_recs = scen.defense_model.recommend(user_id=uid, top_k=k)
-        def_rank, _ = find_rank_of_item(def_recs, target_id)
-        if def_rank is not None:
-            metrics["defense"]["hits"] += 1
-            metrics["defense"]["ranks"].append(def_rank)
+    # Score every sampled user at once per scenario (one matrix product each)
+    recs_by_scenario = {
+        "baseline": scen.baseline_model.recommend_batch(user_ids, top_k=k),
+        "attack": scen.attack_model.recommend_batch(user_ids, top_k=k),
+        "defense": scen.defense_model.recommend_batch(user_ids, top_k=k),
+    }
+
+    for name, all_recs in recs_by_scenario.items():
+        for recs in all_recs:
+            rank, _ = find_rank_of_item(recs, target_id)
+            if rank is not None:
+                metrics[name]["hits"] += 1
+                metrics[name]["ranks"].append(rank)
 
     # Print summary
     print("=== Summary (over users) ===")
@@ -1,9 +1,18 @@
+import copy
+import hashlib
 import os
-from typing import Optional, List, Dict
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Tuple
 
 import numpy as np
 import pandas as pd
 import requests
+import scipy.sparse as sp
+from sklearn.metrics.pairwise import cosine_similarity
 
 
 # ---------- Helpers: load data ----------
@@ -13,13 +22,14 @@ def load_ratings(data_path: str = "u.data") -> pd.DataFrame:
     Load MovieLens ratings from u.data.
     Returns a DataFrame with: user_id, item_id, rating
     """
-    df = pd.read_csv(
+    return pd.read_csv(
         data_path,
         sep="\t",
         names=["user_id", "item_id", "rating", "timestamp"],
-        engine="python",
+        usecols=["user_id", "item_id", "rating"],
+        dtype={"user_id": np.int32, "item_id": np.int32, "rating": np.float32},
+        engine="c",
     )
-    return df[["user_id", "item_id", "rating"]]
 
 
 def load_movie_titles(path: str = "u.item") -> Dict[int, str]:
@@ -36,30 +46,48 @@ def load_movie_titles(path: str = "u.item") -> Dict[int, str]:
         usecols=[0, 1],  # only movie id and title
     )
     df.columns = ["item_id", "title"]
-    return {int(row.item_id): str(row.title) for _, row in df.iterrows()}
+    return dict(zip(df["item_id"].astype(int).tolist(), df["title"].astype(str).tolist()))
 
 
 # ---------- TMDB poster helper ----------
 
 TMDB_API_KEY = os.getenv("TMDB_API_KEY", "")
 _POSTER_CACHE: dict = {}  # title -> url
+# Concurrent TMDB requests in fetch_poster_urls; kept low so a cold
+# start stays under TMDB's rate limit
+POSTER_FETCH_WORKERS = 8
+# After a failed TMDB request (rate limited, timed out, ...) lookups are
+# skipped for this many seconds instead of retrying every title at once
+POSTER_RETRY_AFTER = 60.0
+_poster_retry_at = 0.0  # time.monotonic() until which lookups are skipped
+
+
+def _poster_cache_key(title: str) -> str:
+    """Title without the year in parentheses, lowercased: "cyclo"."""
+    return title.rsplit("(", 1)[0].strip().lower()
 
 
 def fetch_poster_url(title: str) -> str:
     """
     Look up a poster URL for this movie title using TMDB.
-    Results are cached so we don't call TMDB repeatedly.
+    Answers are cached so we don't call TMDB repeatedly; failed requests
+    (rate limiting, timeouts, ...) are not, but pause all lookups for
+    POSTER_RETRY_AFTER seconds, after which they are retried.
     We also strip the year in parentheses, e.g. "Toy Story (1995)" -> "Toy Story".
     """
+    global _poster_retry_at
+
     if not TMDB_API_KEY or not title:
         return ""
 
     # Remove year in parentheses: "Cyclo (1995)" -> "Cyclo"
     clean_title = title.rsplit("(", 1)[0].strip()
 
-    cache_key = clean_title.lower()
+    cache_key = _poster_cache_key(title)
     if cache_key in _POSTER_CACHE:
         return _POSTER_CACHE[cache_key]
+    if time.monotonic() < _poster_retry_at:
+        return ""
 
     try:
         resp = requests.get(
@@ -87,29 +115,144 @@ def fetch_poster_url(title: str) -> str:
         _POSTER_CACHE[cache_key] = url
         return url
     except Exception:
-        _POSTER_CACHE[cache_key] = ""
+        _poster_retry_at = time.monotonic() + POSTER_RETRY_AFTER
         return ""
 
 
+def fetch_poster_urls(titles: List[str]) -> List[str]:
+    """
+    Look up poster URLs for many titles (same order as titles).
+    TMDB calls spend their time waiting on the network, so titles that
+    are not cached yet are looked up on a thread pool instead of one
+    after another.
+    """
+    if not TMDB_API_KEY:
+        return ["" for _ in titles]
+
+    # One lookup per distinct query: "Hamlet (1996)" and "Hamlet (1990)"
+    # both search for "hamlet"
+    keys = [_poster_cache_key(t) for t in titles]
+    missing: Dict[str, str] = {}  # cache key -> title to look up
+    for title, key in zip(titles, keys):
+        if title and key not in _POSTER_CACHE:
+            missing.setdefault(key, title)
+
+    fetched: Dict[str, str] = {}
+    if missing:
+        with ThreadPoolExecutor(max_workers=POSTER_FETCH_WORKERS) as executor:
+            fetched = dict(
+                zip(missing, executor.map(fetch_poster_url, missing.values()))
+            )
+
+    return [
+        fetched[key] if key in fetched else fetch_poster_url(title)
+        for title, key in zip(titles, keys)
+    ]
+
+
+def fill_poster_urls(items: List[dict]) -> None:
+    """
+    Set "poster_url" on recommendation dicts from their "title",
+    with one fetch_poster_urls batch for all of them.
+    """
+    poster_urls = fetch_poster_urls([item["title"] for item in items])
+    for item, poster_url in zip(items, poster_urls):
+        item["poster_url"] = poster_url
+
+
 # ---------- Core CF model ----------
 
+# Everything below runs in float32 (half the memory traffic of float64 and
+# twice the SIMD width); keep constants float32 so they never promote it.
+_EPS = np.float32(1e-8)
+
+# Max similarity entries (items in block × all items) held at once while
+# searching neighbors block by block: 2**24 float32 = 64 MB.
+_SIM_BLOCK_ENTRIES = 2 ** 24
+
+
+def _array_module(backend: str):
+    """
+    Array library for a model backend: numpy, or cupy for "cupy".
+    cupy is only imported when asked for, so it stays an optional install.
+    """
+    if backend == "numpy":
+        return np
+    if backend == "cupy":
+        import cupy
+
+        return cupy
+    raise ValueError(f"Unknown backend: {backend!r} (expected 'numpy' or 'cupy')")
+
+
 class ItemItemCFModel:
     """
     Item-item collaborative filtering model built from a ratings DataFrame.
 
-    - Builds a user × item rating matrix R.
+    - Builds a sparse user × item rating matrix R.
     - Computes item-item cosine similarity.
     - Can recommend items for a given user_id.
+
+    If base_model is given and ratings_df only differs from its ratings by
+    changed values and/or extra users (e.g. the attack and defense
+    scenarios), the similarity is updated from base_model instead of being
+    recomputed from scratch.
+
+    backend="cupy" keeps the similarity matrix on the GPU and runs the
+    similarity and scoring products there (cuBLAS); only the top-k results
+    are copied back. Worth it for large catalogs (tens of thousands of items).
+
+    n_neighbors keeps only each item's n_neighbors most similar items
+    (classic neighborhood CF) in a sparse matrix instead of the full
+    items × items similarity, so scoring only touches those neighbors.
+
+    quantize stores the dense similarity as int8 (round(sim * 127)): a
+    quarter of the float32 memory, so more of it stays in cache while
+    scoring. Scores are a ratio of two sums over the same similarities,
+    so the scale cancels and only the gathered rows are cast to float32.
+
+    fetch_posters=False leaves the popularity items' poster_url empty, for
+    callers that fill several models' posters at once (fill_poster_urls).
     """
 
-    def __init__(self, ratings_df: pd.DataFrame, movie_titles: Optional[dict] = None):
-        ratings = ratings_df.copy()
-        self.ratings = ratings
+    def __init__(
+        self,
+        ratings_df: pd.DataFrame,
+        movie_titles: Optional[dict] = None,
+        base_model: Optional["ItemItemCFModel"] = None,
+        backend: str = "numpy",
+        n_neighbors: Optional[int] = None,
+        quantize: bool = False,
+        fetch_posters: bool = True,
+    ):
+        if n_neighbors is not None and n_neighbors < 1:
+            raise ValueError(f"n_neighbors must be at least 1, got {n_neighbors}")
+        if quantize and n_neighbors is not None:
+            raise ValueError(
+                "quantize applies to the dense similarity; "
+                "it cannot be combined with n_neighbors"
+            )
+
+        # R holds one rating per (user, item): keep the last one for
+        # re-rated pairs, which COO -> CSR below would otherwise sum
+        duplicated = ratings_df.duplicated(["user_id", "item_id"], keep="last")
+        if duplicated.any():
+            ratings_df = ratings_df[~duplicated.to_numpy()]
+
+        # Only read from, never modified, so no defensive copy
+        self.ratings = ratings_df
         self.movie_titles = movie_titles or {}
+        self.backend = backend
+        self.n_neighbors = n_neighbors
+        self.quantize = quantize
+        xp = self.xp
 
         # ----- Build ID mappings -----
-        users = sorted(ratings["user_id"].unique())
-        items = sorted(ratings["item_id"].unique())
+        # Categorical codes are indices into the sorted unique ids
+        users_cat = pd.Categorical(ratings_df["user_id"].to_numpy())
+        items_cat = pd.Categorical(ratings_df["item_id"].to_numpy())
+        users = users_cat.categories
+        items = items_cat.categories
 
         self.user_to_idx = {u: i for i, u in enumerate(users)}
         self.idx_to_user = {i: u for u, i in self.user_to_idx.items()}
@@ -117,59 +260,241 @@ class ItemItemCFModel:
         self.item_to_idx = {m: j for j, m in enumerate(items)}
         self.idx_to_item = {j: m for m, j in self.item_to_idx.items()}
 
+        self.users = users.to_numpy()
+        self.items = items.to_numpy()
+
         n_users = len(users)
         n_items = len(items)
         self.n_items = n_items
 
         # ----- Build user-item matrix R (users × items) -----
-        R = np.zeros((n_users, n_items), dtype=np.float32)
-        for row in ratings.itertuples(index=False):
-            u = self.user_to_idx[row.user_id]
-            i = self.item_to_idx[row.item_id]
-            R[u, i] = row.rating
+        # MovieLens is mostly empty, so keep R sparse. The rating column
+        # goes straight into a COO matrix (no intermediate copies), which
+        # is then converted once to CSR for fast row access.
+        R = sp.coo_matrix(
+            (
+                ratings_df["rating"].to_numpy(dtype=np.float32),
+                (users_cat.codes, items_cat.codes),
+            ),
+            shape=(n_users, n_items),
+        ).tocsr()
 
         self.R = R  # shape (n_users, n_items)
 
+        # ----- Ratings grouped by item -----
+        # The ratings of item j are item_ratings[item_offsets[j]:item_offsets[j + 1]],
+        # so per-item aggregates (norms, popularity) are contiguous segment
+        # reductions instead of scattered column lookups.
+        # Every item in the mapping has at least one rating.
+        R_csc = R.tocsc()
+        self.item_offsets = R_csc.indptr
+        self.item_ratings = R_csc.data
+        item_starts = self.item_offsets[:-1]
+        item_counts = np.diff(self.item_offsets)
+
         # ----- Compute item-item cosine similarity -----
-        # Each column is an item vector (all users' ratings for that item)
-        item_vectors = R  # (n_users, n_items)
+        # Each column of R is an item vector (all users' ratings for that item).
+        # S = (X^T X) / (||xi|| * ||xj||)
+        self.item_norms = np.sqrt(
+            np.add.reduceat(self.item_ratings * self.item_ratings, item_starts)
+        )
+
+        if base_model is not None and self._extends(base_model):
+            S = self._updated_similarity(base_model)
+        elif n_neighbors is not None:
+            S = None  # neighbors are searched block by block below
+        elif backend == "cupy":
+            import cupyx.scipy.sparse
 
-        # Norm of each item vector
-        norms = np.linalg.norm(item_vectors, axis=0)  # length n_items
-        norms[norms == 0] = 1e-8  # avoid divide-by-zero
+            R_gpu = cupyx.scipy.sparse.csr_matrix(R)
+            S = self._normalize_gram((R_gpu.T @ R_gpu).toarray())
+        else:
+            # Sparse product; items with no ratings get a zero row
+            # instead of dividing by zero.
+            S = cosine_similarity(R.T)  # items × items, dense
+        if S is not None:
+            xp.clip(S, -1.0, 1.0, out=S)  # keep within [-1, 1]
 
-        # Similarity matrix S = (X^T X) / (||xi|| * ||xj||)
-        S = item_vectors.T @ item_vectors  # items × items
-        S = S / (norms[None, :] * norms[:, None])
-        S = np.clip(S, -1.0, 1.0)  # keep within [-1, 1]
+        if n_neighbors is not None:
+            S = self._top_neighbors(n_neighbors, S)
+        elif quantize:
+            S = self._quantized(S)
 
         self.sim = S
+        # |sim| is fixed after training; keep it for the score denominators
+        self.abs_sim = abs(S)
 
         # ----- Popularity backup (for cold-start) -----
-        movie_stats = (
-            ratings.groupby("item_id")["rating"]
-            .agg(["mean", "count"])
-            .reset_index()
+        item_means = (
+            np.add.reduceat(self.item_ratings.astype(np.float64), item_starts)
+            / item_counts
         )
-        movie_stats = movie_stats[movie_stats["count"] >= 20].copy()
-        movie_stats = movie_stats.sort_values(
-            by=["mean", "count"], ascending=[False, False]
+        # Items with >= 20 ratings, by mean then count (both descending)
+        order = np.lexsort((-item_counts, -item_means))
+        order = order[item_counts[order] >= 20]
+
+        item_ids = [int(self.idx_to_item[j]) for j in order]
+        means = item_means[order]
+        popular_items = [
+            {
+                "item_id": item_id,
+                "title": self.movie_titles.get(item_id, ""),
+                "poster_url": "",
+                "score": float(mean),
+            }
+            for item_id, mean in zip(item_ids, means)
+        ]
+        self.popular_items = popular_items
+        if fetch_posters:
+            fill_poster_urls(popular_items)
+
+    @property
+    def xp(self):
+        """numpy or cupy, depending on where this model's arrays live."""
+        return _array_module(self.backend)
+
+    def _extends(self, base: "ItemItemCFModel") -> bool:
+        """
+        True if this model has the same items as base and its users are
+        base's users plus (optionally) new ones sorted after them, i.e.
+        base.R lines up with the top rows of self.R.
+        """
+        n_base = len(base.users)
+        return (
+            base.backend == self.backend
+            and np.array_equal(self.items, base.items)
+            and np.array_equal(self.users[:n_base], base.users)
+            # needs the full float similarity
+            and base.n_neighbors is None
+            and not base.quantize
         )
 
-        popular_items = []
-        for _, row in movie_stats.iterrows():
-            item_id = int(row["item_id"])
-            title = self.movie_titles.get(item_id, "")
-            poster_url = fetch_poster_url(title)
-            popular_items.append(
-                {
-                    "item_id": item_id,
-                    "title": title,
-                    "poster_url": poster_url,
-                    "score": float(row["mean"]),
-                }
+    def _updated_similarity(self, base: "ItemItemCFModel"):
+        """
+        Cosine similarity for self.R, derived from base's similarity.
+
+        With X = base.R (padded with empty rows for new users) and the
+        sparse change D = R - X:
+
+            R^T R = X^T X + D^T X + X^T D + D^T D
+
+        X^T X is recovered from base.sim and base.item_norms, so only the
+        products involving D are computed. For one attacker row D is rank-1;
+        for the defense it only touches the clipped ratings.
+        """
+        xp = self.xp
+        X = base.R.copy()
+        X.resize(self.R.shape)
+        D = (self.R - X).tocsr()
+        D.eliminate_zeros()
+
+        DtX = D.T @ X
+        delta = DtX + DtX.T + D.T @ D
+
+        # gram = base.sim * ||xi|| * ||xj||, built in one buffer
+        base_norms = xp.asarray(base.item_norms)
+        gram = base.sim * base_norms[:, None]
+        gram *= base_norms[None, :]
+
+        # Add the sparse delta in place (COO entries are unique here)
+        delta = delta.tocoo()
+        gram[xp.asarray(delta.row), xp.asarray(delta.col)] += xp.asarray(delta.data)
+        return self._normalize_gram(gram)
+
+    def _normalize_gram(self, gram):
+        """
+        Turn the item Gram matrix X^T X into cosine similarity by dividing
+        by ||xi|| * ||xj||. Works in place on gram: no items × items
+        temporaries.
+        """
+        xp = self.xp
+        norms = xp.asarray(self.item_norms).copy()
+        norms[norms == 0] = _EPS  # avoid divide-by-zero
+        gram /= norms[:, None]
+        gram /= norms[None, :]
+        return gram
+
+    def _top_neighbors(self, n_neighbors: int, S=None):
+        """
+        Keep only each item's n_neighbors most similar other items.
+
+        Returns a sparse CSR matrix whose row i holds item i's neighbors
+        (int32 column indices, float32 similarities). Scoring a user then
+        gathers the rows of their rated items and scatter-adds them.
+
+        Items are processed in blocks of rows. If the full similarity S is
+        not given, each block is computed from the normalized item vectors
+        (exact k-NN search), so the items × items matrix never exists in
+        memory. If S is given, its diagonal is overwritten.
+        """
+        xp = self.xp
+        n_items = self.n_items
+        n = min(n_neighbors, n_items)
+        block_size = max(1, _SIM_BLOCK_ENTRIES // n_items)
+
+        if S is None:
+            V = self._normalized_item_vectors()
+
+        top = np.empty((n_items, n), dtype=np.int32)
+        top_sims = np.empty((n_items, n), dtype=np.float32)
+        for start in range(0, n_items, block_size):
+            stop = min(start + block_size, n_items)
+            if S is None:
+                block = (V[:, start:stop].T @ V).toarray()
+                xp.clip(block, -1.0, 1.0, out=block)
+            else:
+                block = S[start:stop]
+
+            # An item is not its own neighbor
+            rows = xp.arange(stop - start)
+            block[rows, rows + start] = 0
+
+            block_top = xp.argpartition(-block, n - 1, axis=1)[:, :n]
+            top[start:stop] = self._to_numpy(block_top)
+            top_sims[start:stop] = self._to_numpy(
+                xp.take_along_axis(block, block_top, axis=1)
             )
-        self.popular_items = popular_items
+
+        neighbors = sp.csr_matrix(
+            (top_sims.ravel(), top.ravel(), np.arange(0, n_items * n + 1, n)),
+            shape=(n_items, n_items),
+        )
+        neighbors.eliminate_zeros()  # drop "neighbors" with no overlap
+
+        if xp is not np:
+            import cupyx.scipy.sparse
+
+            return cupyx.scipy.sparse.csr_matrix(neighbors)
+        return neighbors
+
+    def _normalized_item_vectors(self):
+        """
+        R with every item column scaled to unit length (sparse CSC, on the
+        model's backend), so V^T V is the cosine similarity.
+        """
+        norms = self.item_norms.copy()
+        norms[norms == 0] = 1  # empty columns stay empty
+        V = (self.R @ sp.diags(1 / norms)).tocsc()
+        if self.backend == "cupy":
+            import cupyx.scipy.sparse
+
+            return cupyx.scipy.sparse.csc_matrix(V)
+        return V
+
+    def _quantized(self, S):
+        """
+        int8 copy of a dense similarity with values in [-1, 1], as
+        round(S * 127). Overwrites S.
+        """
+        xp = self.xp
+        S *= 127
+        xp.rint(S, out=S)
+        return S.astype(xp.int8)
+
+    def _to_numpy(self, a) -> np.ndarray:
+        """Copy a backend array to host memory (no-op for numpy)."""
+        xp = self.xp
+        return a if xp is np else xp.asnumpy(a)
 
     def popularity_recs(self, top_k: int = 5) -> List[dict]:
         return self.popular_items[:top_k]
@@ -179,53 +504,128 @@ class ItemItemCFModel:
         Recommend top_k items for this user.
         If the user is unknown or has no ratings, fall back to popularity.
         """
-        if user_id not in self.user_to_idx:
-            return self.popularity_recs(top_k=top_k)
+        return self.recommend_batch([user_id], top_k=top_k)[0]
 
-        u = self.user_to_idx[user_id]
-        user_ratings = self.R[u, :]  # shape (n_items,)
-
-        rated_mask = user_ratings > 0
-        if not rated_mask.any():
-            return self.popularity_recs(top_k=top_k)
-
-        scores = np.zeros(self.n_items, dtype=np.float32)
+    def recommend_batch(self, user_ids: List[int], top_k: int = 5) -> List[List[dict]]:
+        """
+        Recommend top_k items for each user in user_ids (same order).
 
-        # For each item j the user has NOT rated, predict a score
-        for j in range(self.n_items):
-            if rated_mask[j]:
-                continue  # skip items already rated
+        All known users are scored together with one matrix product, which is
+        much cheaper than calling recommend() once per user.
+        Unknown users and users with no ratings fall back to popularity.
+        """
+        known = [uid for uid in user_ids if uid in self.user_to_idx]
+        recs_by_user: Dict[int, List[dict]] = {}
+
+        if known:
+            rows = [self.user_to_idx[uid] for uid in known]
+            U = self.R[rows].toarray()  # (n_users_in_batch, n_items)
+            top_indices, top_scores = self._top_k_items(self._score_users(U), top_k)
+            # Use only positive scores as candidates
+            positive = top_scores > 0
+
+            # Posters for the whole batch in one lookup
+            titles = [
+                self.movie_titles.get(int(self.idx_to_item[j]), "")
+                for j in top_indices[positive]
+            ]
+            poster_urls = fetch_poster_urls(titles)
+            ends = np.cumsum(positive.sum(axis=1))
+
+            for uid, indices, scores, keep, end in zip(
+                known, top_indices, top_scores, positive, ends
+            ):
+                start = end - int(keep.sum())
+                recs_by_user[uid] = self._make_recs(
+                    indices[keep], scores[keep], poster_urls[start:end]
+                )
+
+        return [
+            recs_by_user.get(uid) or self.popularity_recs(top_k=top_k)
+            for uid in user_ids
+        ]
+
+    def _score_users(self, U: np.ndarray):
+        """
+        Predicted scores for a batch of user rating rows U (users × items):
 
-            sims = self.sim[j, rated_mask]     # similarities
-            r = user_ratings[rated_mask]       # user ratings
+            score[u, j] = sum_i sim[i, j] * r[u, i] / sum_i |sim[i, j]|
 
-            if np.all(sims == 0):
-                continue
+        summed over the items i that user u has rated. Already-rated items
+        score 0. The result lives on the model's backend (numpy or cupy).
+        """
+        xp = self.xp
+        U = xp.asarray(U)
+        rated_mask = U > 0
+
+        # Only rows of sim for items someone in the batch rated contribute.
+        # sim is symmetric, so gathering (contiguous) rows is enough.
+        rated = xp.flatnonzero(rated_mask.any(axis=0))
+        ratings = U[:, rated]
+        weights = rated_mask[:, rated].astype(xp.float32)
+        if self.n_neighbors is None:
+            sims = self.sim[rated]
+            abs_sims = self.abs_sim[rated]
+            if self.quantize:
+                # Only the gathered rows go back to float32; the int8
+                # scale is the same in num and denom and cancels out.
+                sims = sims.astype(xp.float32)
+                abs_sims = abs_sims.astype(xp.float32)
+            num = ratings @ sims
+            denom = weights @ abs_sims
+        else:
+            # Sparse neighbor rows: (sparse^T @ dense)^T works for both
+            # scipy and cupyx sparse matrices.
+            num = (self.sim[rated].T @ ratings.T).T
+            denom = (self.abs_sim[rated].T @ weights.T).T
+
+        # Finish in the product buffers: no extra (users × items) temporaries
+        denom += _EPS
+        num /= denom
+        num[rated_mask] = 0  # skip items already rated
+        return num
+
+    def _top_k_items(self, scores, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Row-wise top_k of a (users × items) score matrix, best first.
+        Returns (item indices, scores) as numpy arrays of shape (users, k);
+        only these leave the GPU on the cupy backend.
+        """
+        xp = self.xp
+        k = max(0, min(top_k, scores.shape[1]))
+        if k < scores.shape[1]:
+            # Partial sort: pull out the top k, then order only those
+            top = xp.argpartition(-scores, k, axis=1)[:, :k]
+        else:
+            top = xp.broadcast_to(xp.arange(scores.shape[1]), scores.shape)
+        top_scores = xp.take_along_axis(scores, top, axis=1)
 
-            num = float(np.dot(sims, r))
-            denom = float(np.sum(np.abs(sims)) + 1e-8)
-            scores[j] = num / denom
+        order = xp.argsort(-top_scores, axis=1)  # sort desc
+        top = xp.take_along_axis(top, order, axis=1)
+        top_scores = xp.take_along_axis(top_scores, order, axis=1)
 
-        # Use only positive scores as candidates
-        candidate_indices = np.where(scores > 0)[0]
-        if len(candidate_indices) == 0:
-            return self.popularity_recs(top_k=top_k)
+        return self._to_numpy(top), self._to_numpy(top_scores)
 
-        candidate_scores = scores[candidate_indices]
-        order = np.argsort(-candidate_scores)  # sort desc
-        top_indices = candidate_indices[order][:top_k]
+    def _make_recs(
+        self, top_indices: np.ndarray, scores: np.ndarray, poster_urls: List[str]
+    ) -> List[dict]:
+        """
+        Build recommendation dicts for ranked item indices, with their
+        already looked-up poster URLs.
+        """
+        item_ids = [int(self.idx_to_item[j]) for j in top_indices]
+        titles = [self.movie_titles.get(item_id, "") for item_id in item_ids]
 
         recs: List[dict] = []
-        for j in top_indices:
-            item_id = self.idx_to_item[j]
-            title = self.movie_titles.get(item_id, "")
-            poster_url = fetch_poster_url(title)
+        for item_id, title, poster_url, score in zip(
+            item_ids, titles, poster_urls, scores
+        ):
             recs.append(
                 {
-                    "item_id": int(item_id),
+                    "item_id": item_id,
                     "title": title,
                     "poster_url": poster_url,
-                    "score": float(scores[j]),
+                    "score": float(score),
                 }
             )
         return recs
@@ -247,34 +647,29 @@ def simulate_attack(
     - Give some other items also high ratings
     """
     rng = np.random.default_rng(42)
-    df = ratings_df.copy()
 
-    all_items = df["item_id"].unique()
-    candidate_items = [i for i in all_items if i != target_item_id]
+    all_items = ratings_df["item_id"].unique()
+    candidate_items = all_items[all_items != target_item_id]
 
     if len(candidate_items) > n_push_items:
         push_items = rng.choice(candidate_items, size=n_push_items, replace=False)
     else:
         push_items = candidate_items
 
-    new_rows = []
-
-    # Attack the target item
-    new_rows.append(
-        {"user_id": attacker_id, "item_id": target_item_id, "rating": extreme_rating}
+    # The target item plus the pushed items, all rated by the attacker
+    new_item_ids = np.concatenate([[target_item_id], push_items]).astype(np.int32)
+    new_user_ids = np.full(len(new_item_ids), attacker_id, dtype=np.int32)
+    new_ratings = np.full(len(new_item_ids), extreme_rating, dtype=np.float32)
+
+    # Append the new rows column by column and build the frame once
+    df_attack = pd.DataFrame(
+        {
+            "user_id": np.concatenate([ratings_df["user_id"].to_numpy(), new_user_ids]),
+            "item_id": np.concatenate([ratings_df["item_id"].to_numpy(), new_item_ids]),
+            "rating": np.concatenate([ratings_df["rating"].to_numpy(), new_ratings]),
+        }
     )
 
-    # Give high ratings to some other items
-    for it in push_items:
-        new_rows.append(
-            {"user_id": attacker_id, "item_id": int(it), "rating": extreme_rating}
-        )
-
-    if new_rows:
-        df_attack = pd.concat([df, pd.DataFrame(new_rows)], ignore_index=True)
-    else:
-        df_attack = df
-
     return df_attack
 
 
@@ -286,23 +681,34 @@ def apply_defense(ratings_df: pd.DataFrame, tau: float = 1.5) -> pd.DataFrame:
       - Compute mean and std of their ratings.
       - Clip any rating that is more than tau * std away from the mean.
     """
+    df = ratings_df.reset_index(drop=True)
+    if df.empty:
+        return df
+
+    # Sort so each user's ratings are one contiguous run, then do the
+    # per-user mean/std with segment reductions instead of a groupby.
+    order = np.argsort(df["user_id"].to_numpy(), kind="stable")
+    users = df["user_id"].to_numpy()[order]
+    ratings = df["rating"].to_numpy(dtype=float)[order]
+
+    starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+    counts = np.diff(np.r_[starts, len(users)])
+
+    mu = np.repeat(np.add.reduceat(ratings, starts) / counts, counts)
+    sigma = np.sqrt(np.add.reduceat((ratings - mu) ** 2, starts) / counts)
+    sigma = np.repeat(sigma, counts)
 
-    def clip_user(group: pd.DataFrame) -> pd.DataFrame:
-        ratings = group["rating"].values.astype(float)
-        mu = ratings.mean()
-        sigma = ratings.std()
-        if sigma < 1e-6:
-            return group
+    lower = mu - tau * sigma
+    upper = mu + tau * sigma
+    clipped = np.clip(ratings, lower, upper)
 
-        lower = mu - tau * sigma
-        upper = mu + tau * sigma
-        clipped = np.clip(ratings, lower, upper)
-        group = group.copy()
-        group["rating"] = clipped
-        return group
+    # Users with (almost) constant ratings are left alone
+    defended = np.empty_like(ratings)
+    defended[order] = np.where(sigma < 1e-6, ratings, clipped)
 
-    defended = ratings_df.groupby("user_id", group_keys=False).apply(clip_user)
-    return defended.reset_index(drop=True)
+    df = df.copy()
+    df["rating"] = defended
+    return df
 
 
 # ---------- Scenario wrapper ----------
@@ -316,9 +722,55 @@ class ScenarioRecommender:
       - defense:  trained on attacked ratings after clipping outliers
 
     Frontend chooses which one by sending scenario = 'baseline' / 'attack' / 'defense'.
+    backend, n_neighbors and quantize are passed to each ItemItemCFModel.
+
+    If cache_dir is given, the built models are pickled there, keyed by the
+    contents of the data files, this module's source and the build
+    settings, so later starts just load them. The TMDB poster cache is
+    saved with them; only titles it has no answer for are looked up again.
     """
 
-    def __init__(self, data_path: str = "u.data", movie_path: str = "u.item"):
+    # Max number of (scenario, user_id, top_k) results kept in memory
+    RECS_CACHE_SIZE = 10000
+
+    def __init__(
+        self,
+        data_path: str = "u.data",
+        movie_path: str = "u.item",
+        backend: str = "numpy",
+        n_neighbors: Optional[int] = None,
+        quantize: bool = False,
+        cache_dir: Optional[str] = None,
+    ):
+        # LRU cache of recommendation lists. The models are fixed once
+        # built, so the ranked items for a request never change; posters
+        # are attached again on every call (see recommend).
+        self._recs_cache: "OrderedDict[tuple, List[dict]]" = OrderedDict()
+        self._recs_lock = threading.Lock()
+
+        model_options = {
+            "backend": backend,
+            "n_neighbors": n_neighbors,
+            "quantize": quantize,
+        }
+
+        cache_path = None
+        if cache_dir:
+            key = self._cache_key(data_path, movie_path, model_options)
+            cache_path = os.path.join(cache_dir, f"scenarios-{key}.pkl")
+            if self._load_cache(cache_path):
+                return
+
+        self._build(data_path, movie_path, model_options)
+
+        if cache_path:
+            self._save_cache(cache_path)
+
+    def _build(self, data_path: str, movie_path: str, model_options: dict):
+        """
+        Build the baseline / attack / defense models from scratch, passing
+        model_options to every ItemItemCFModel.
+        """
         # Load clean ratings and movie titles
         base_ratings = load_ratings(data_path)
         movie_titles = load_movie_titles(movie_path)
@@ -327,7 +779,9 @@ class ScenarioRecommender:
         self.movie_titles = movie_titles
 
         # Baseline model
-        self.baseline_model = ItemItemCFModel(base_ratings, movie_titles)
+        self.baseline_model = ItemItemCFModel(
+            base_ratings, movie_titles, fetch_posters=False, **model_options
+        )
 
         # Choose an attacker id (new fake user) and a target item
         rng = np.random.default_rng(42)
@@ -348,20 +802,152 @@ class ScenarioRecommender:
             extreme_rating=5.0,
         )
         self.attack_ratings = attack_ratings
-        self.attack_model = ItemItemCFModel(attack_ratings, movie_titles)
+        self.attack_model = ItemItemCFModel(
+            attack_ratings,
+            movie_titles,
+            base_model=self.baseline_model,
+            fetch_posters=False,
+            **model_options,
+        )
 
         # Defense model
         defended_ratings = apply_defense(attack_ratings, tau=1.5)
         self.defense_ratings = defended_ratings
-        self.defense_model = ItemItemCFModel(defended_ratings, movie_titles)
+        self.defense_model = ItemItemCFModel(
+            defended_ratings,
+            movie_titles,
+            base_model=self.attack_model,
+            fetch_posters=False,
+            **model_options,
+        )
+
+        self._fill_popular_posters()
+
+    # Attributes that are rebuilt per process instead of being pickled
+    _UNCACHED_ATTRS = ("_recs_cache", "_recs_lock")
+
+    _MODEL_ATTRS = ("baseline_model", "attack_model", "defense_model")
+
+    @classmethod
+    def _cache_key(cls, data_path: str, movie_path: str, model_options: dict) -> str:
+        """
+        Hash of everything the built models depend on: both data files,
+        the code that builds them (this module) and the build settings.
+        """
+        h = hashlib.md5()
+        for path in (data_path, movie_path, __file__):
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+        h.update(repr(sorted(model_options.items())).encode())
+        return h.hexdigest()
+
+    def _load_cache(self, cache_path: str) -> bool:
+        """
+        Restore the built models from cache_path. Returns False (and
+        leaves self untouched) if there is no usable cache file.
+        """
+        try:
+            with open(cache_path, "rb") as f:
+                state, poster_cache = pickle.load(f)
+        except Exception:
+            # No cache yet, or an unreadable one: rebuild and overwrite it
+            return False
+
+        self.__dict__.update(state)
+        for name in self._MODEL_ATTRS:
+            model = getattr(self, name)
+            model.abs_sim = abs(model.sim)
+
+        for key, poster_url in poster_cache.items():
+            _POSTER_CACHE.setdefault(key, poster_url)
+        self._fill_popular_posters()
+        return True
+
+    def _fill_popular_posters(self) -> None:
+        """
+        Look up the popularity items' posters of all three models together,
+        so titles they share are only looked up once.
+        """
+        fill_poster_urls(
+            [
+                item
+                for name in self._MODEL_ATTRS
+                for item in getattr(self, name).popular_items
+            ]
+        )
+
+    def _save_cache(self, cache_path: str) -> None:
+        """
+        Pickle the built models to cache_path. The file is written under a
+        temporary name and renamed, so concurrent workers never read a
+        partial file. Failing to write the cache is not an error.
+        """
+        state = {
+            name: value
+            for name, value in self.__dict__.items()
+            if name not in self._UNCACHED_ATTRS
+        }
+        for name in self._MODEL_ATTRS:
+            state[name] = self._cacheable_model(state[name])
+        # Only answers are in the poster cache (never failed lookups)
+        poster_cache = dict(_POSTER_CACHE)
+
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                pickle.dump((state, poster_cache), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @staticmethod
+    def _cacheable_model(model: ItemItemCFModel) -> ItemItemCFModel:
+        """
+        Shallow copy of model to pickle: abs_sim is recomputed on load, and
+        poster URLs come from the poster cache, so a failed lookup ("")
+        is never stored.
+        """
+        cached = copy.copy(model)
+        del cached.abs_sim
+        cached.popular_items = [
+            {**item, "poster_url": ""} for item in model.popular_items
+        ]
+        return cached
 
     def recommend(self, scenario: str, user_id: int, top_k: int = 5) -> List[dict]:
+        """
+        Recommend top_k items for this user under the given scenario.
+        The ranked items are cached per (scenario, user_id, top_k).
+        """
         scenario = (scenario or "").lower()
         if scenario == "attack":
             model = self.attack_model
         elif scenario == "defense":
             model = self.defense_model
         else:
+            scenario = "baseline"
             model = self.baseline_model
 
-        return model.recommend(user_id=user_id, top_k=top_k)
\ No newline at end of file
+        key = (scenario, user_id, top_k)
+        with self._recs_lock:
+            recs = self._recs_cache.get(key)
+            if recs is not None:
+                self._recs_cache.move_to_end(key)
+
+        if recs is None:
+            recs = model.recommend(user_id=user_id, top_k=top_k)
+            with self._recs_lock:
+                self._recs_cache[key] = recs
+                if len(self._recs_cache) > self.RECS_CACHE_SIZE:
+                    self._recs_cache.popitem(last=False)  # drop least recently used
+
+        # Posters come from the poster cache rather than the cached list, so
+        # a failed TMDB lookup is retried instead of being kept with it
+        poster_urls = fetch_poster_urls([rec["title"] for rec in recs])
+        return [
+            {**rec, "poster_url": poster_url}
+            for rec, poster_url in zip(recs, poster_urls)
+        ]
@@ -0,0 +1,61 @@
+# similarity_check.py
+"""
+Check that the attack / defense similarities derived from the previous
+model (ItemItemCFModel(..., base_model=...)) match a full recompute:
+- attack:  baseline ratings + a new fake user
+- defense: attacked ratings with changed (clipped) values
+
+Exits with status 1 if either check fails.
+"""
+
+import sys
+
+import numpy as np
+
+from recommender import ItemItemCFModel, apply_defense, load_ratings, simulate_attack
+
+ATOL = 1e-5
+
+
+def check_updated_similarity(name, ratings, base_model):
+    """
+    Build a model from ratings both ways and compare their similarities.
+    Returns (derived model, True if they agree).
+    """
+    derived = ItemItemCFModel(ratings, base_model=base_model)
+    full = ItemItemCFModel(ratings)
+
+    # Otherwise this would compare two full recomputes
+    if not derived._extends(base_model):
+        print(f"{name:<8}: FAIL (base model was not used)")
+        return derived, False
+
+    max_diff = float(np.abs(derived.sim - full.sim).max())
+    ok = np.allclose(derived.sim, full.sim, rtol=0, atol=ATOL)
+    print(f"{name:<8}: {'ok' if ok else 'FAIL'} (max |diff| = {max_diff:.2e})")
+    return derived, ok
+
+
+def main():
+    base_ratings = load_ratings("u.data")
+    baseline = ItemItemCFModel(base_ratings)
+
+    print("=== Updated similarity vs full recompute ===")
+
+    # New user: one attacker rating the most popular item and some others
+    attacker_id = int(base_ratings["user_id"].max() + 1)
+    target_item_id = int(base_ratings["item_id"].value_counts().index[0])
+    attack_ratings = simulate_attack(base_ratings, attacker_id, target_item_id)
+    attack, attack_ok = check_updated_similarity("attack", attack_ratings, baseline)
+
+    # Changed values: same users and items, outlier ratings clipped
+    defended_ratings = apply_defense(attack_ratings, tau=1.5)
+    _, defense_ok = check_updated_similarity("defense", defended_ratings, attack)
+
+    if not (attack_ok and defense_ok):
+        sys.exit(1)
+    print("\nDone.")
+
+
+if __name__ == "__main__":
+    main()